@@ -2,37 +2,378 @@
 from __future__ import annotations
 
 import argparse
+import fnmatch
+import glob
+import hashlib
 import os
 import random
 import re
+import sqlite3
+import stat
+import subprocess
+import sys
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Tuple, Optional
+from functools import lru_cache, partial
+from itertools import accumulate, chain, islice
+from typing import Iterable, Iterator, List, NamedTuple, Tuple, Optional
+from urllib.parse import quote
 
 HEADER_SCAN_LINES = 20  # only look near the top
+HEADER_PREFIX_BYTES = 4096  # first read; an 80-column header is ~1 KB
+HEADER_PREFIX_MAX = 64 * 1024  # never read more than this just to detect
+COPY_CHUNK = 1024 * 1024  # fallback body copy size when the kernel can't splice
+HEADERIGNORE_FILE = ".headerignore"
+HEADER_LINES = 11  # lines in a generated header block
+STATE_CACHE_FILE = os.path.join(".cache", "norminette-header-replace.sqlite")
+FSYNC_MODES = ("none", "each", "batch")
+UPDATE_MODES = ("block", "fields", "updated")
+NUMPY_MIN_FILES = 10_000  # plans at least this long use NumPy when it is installed
 
 # Detect existing 42-ish fields
-RE_BY      = re.compile(r"(.*?\bBy:\s*)([^<\n]*)(\s*)(<[^>]*>)?(.*)$")
+# By: name is words separated by single spaces; the ASCII art follows after a wider gap.
+# The email may have been cut short (no ">") by a header truncated to width.
+RE_BY      = re.compile(r"(.*?\bBy:\s*)([^\s<]+(?: [^\s<]+)*)?(\s*)(<[^>]*>|<\S*)?(.*)$")
 RE_CREATED = re.compile(r"(.*?\bCreated:\s*)(\d{4}/\d{2}/\d{2}\s+\d{2}:\d{2}:\d{2})(\s+by\s+.*)$")
 RE_UPDATED = re.compile(r"(.*?\bUpdated:\s*)(\d{4}/\d{2}/\d{2}\s+\d{2}:\d{2}:\d{2})(\s+by\s+.*)$")
 
+_HEADER_SIGNATURE = (b"By:", b"Created:", b"Updated:")
+# "/* **** */", "# **** #", "-- ---- --", "! //// !", ...
+_RE_BORDER = re.compile(r"^\S+ ([*/-])\1{9,} \S+\s*$")
+# "  by name" after a Created/Updated date, then the ASCII art
+_RE_BY_TAIL = re.compile(r"(\s+by\s+)(\S+(?: \S+)*)(.*)$")
+# First text after the comment opener, up to the gap before the ASCII art
+_RE_TEXT = re.compile(r"^\S+\s+(\S+(?: \S+)*)")
+
 # ---------- Utilities ----------
 
+_TWO_DIGITS = tuple(f"{i:02d}" for i in range(100))
+_DAY_PREFIXES: dict = {}  # date ordinal -> "YYYY/MM/DD "
+_STAMPS: dict = {}  # datetime -> format_42 text
+_STAMPS_MAX = 1 << 20
+
+def _render_42(ordinal: int, second_of_day: int) -> str:
+    """format_42 from integers: a cached date prefix plus two-digit lookups."""
+    prefix = _DAY_PREFIXES.get(ordinal)
+    if prefix is None:
+        d = datetime.fromordinal(ordinal)
+        prefix = _DAY_PREFIXES[ordinal] = f"{d.year:04d}/{d.month:02d}/{d.day:02d} "
+    hours, rem = divmod(second_of_day, 3600)
+    minutes, seconds = divmod(rem, 60)
+    return prefix + _TWO_DIGITS[hours] + ":" + _TWO_DIGITS[minutes] + ":" + _TWO_DIGITS[seconds]
+
 def format_42(dt: datetime) -> str:
-    """42 header datetime format."""
-    return dt.strftime("%Y/%m/%d %H:%M:%S")
+    """42 header datetime format (memoized: each stamp is rendered once)."""
+    text = _STAMPS.get(dt)
+    if text is None:
+        if len(_STAMPS) >= _STAMPS_MAX:
+            _STAMPS.clear()
+        text = _STAMPS[dt] = _render_42(dt.toordinal(), dt.hour * 3600 + dt.minute * 60 + dt.second)
+    return text
+
+def read_head(path: str) -> Tuple[bytes, bool]:
+    """
+    Read only the top of the file: enough bytes to hold HEADER_SCAN_LINES
+    lines, capped at HEADER_PREFIX_MAX. Returns (prefix, at_eof).
+    """
+    with open(path, "rb") as f:
+        data = f.read(HEADER_PREFIX_BYTES)
+        at_eof = len(data) < HEADER_PREFIX_BYTES
+        while (not at_eof and len(data) < HEADER_PREFIX_MAX
+               and data.count(b"\n") < HEADER_SCAN_LINES):
+            chunk = f.read(HEADER_PREFIX_BYTES)
+            at_eof = len(chunk) < HEADER_PREFIX_BYTES
+            data += chunk
+    return data, at_eof
+
+def head_lines(prefix: bytes, at_eof: bool) -> List[bytes]:
+    """
+    Split a prefix into its first HEADER_SCAN_LINES complete lines.
+    A trailing partial line is dropped unless the prefix is the whole file.
+    """
+    lines = prefix.splitlines(keepends=True)
+    if lines and not at_eof and not lines[-1].endswith(b"\n"):
+        lines.pop()
+    return lines[:HEADER_SCAN_LINES]
+
+def has_42_header(prefix: bytes, at_eof: bool) -> bool:
+    """
+    By/Created/Updated within the first HEADER_SCAN_LINES complete lines
+    of a read_head prefix, found with bytes.find bounds instead of
+    decoding, splitting or slicing.
+    """
+    nl = b"\n" if b"\n" in prefix else b"\r"
+    end = 0
+    for _ in range(HEADER_SCAN_LINES):
+        i = prefix.find(nl, end)
+        if i == -1:
+            if at_eof:
+                end = len(prefix)  # last line without a newline
+            break
+        end = i + 1
+    return all(prefix.find(sig, 0, end) != -1 for sig in _HEADER_SIGNATURE)
 
 def looks_like_42_header(lines: List[str]) -> bool:
-    """Cheap signature: has By/Created/Updated near the top."""
-    chunk = "\n".join(lines[:HEADER_SCAN_LINES])
-    return all(s in chunk for s in ("By:", "Created:", "Updated:"))
+    """Cheap signature: has By/Created/Updated near the top (decoded lines)."""
+    head = "\n".join(lines[:HEADER_SCAN_LINES]).encode("utf-8", "surrogateescape")
+    return has_42_header(head, True)
+
+class Header:
+    """
+    A 42 header found by parse_header. Line indexes refer to head_lines();
+    [start, end) is the header's line span and [byte_start, byte_end) its
+    bytes in the file; `framed` is False when no border lines enclose it.
+    Field values are as written (dates as strings).
+    """
+    __slots__ = (
+        "start", "end", "byte_start", "byte_end", "line_ending",
+        "framed", "by_idx", "created_idx", "updated_idx",
+        "filename", "by", "email", "created", "updated",
+    )
+
+    def __init__(self, **fields) -> None:
+        for k in self.__slots__:
+            setattr(self, k, fields.get(k))
+
+def _in_frame(raw: bytes, border: List[str]) -> bool:
+    """True if the line opens and closes like the border line (e.g. "/*" ... "*/")."""
+    line = raw.decode("utf-8", errors="ignore").strip()
+    return line.startswith(border[0]) and line.endswith(border[-1])
+
+def parse_header(raw_lines: List[bytes]) -> Optional[Header]:
+    """
+    Single pass over the head lines: find the By/Created/Updated lines with
+    RE_BY/RE_CREATED/RE_UPDATED and the border lines around them, and pull
+    out the field values. The borders only count where the standard 11-line
+    layout puts them (at most 5 lines above By, 2 below Updated) with
+    nothing but comment lines of the same style in between; otherwise the
+    header is not `framed` and its span is just the lines identified, By
+    through Updated, so nothing around it is ever part of it. Returns None
+    if the fields are not all there.
+    """
+    start = end = by_idx = created_idx = updated_idx = None
+    by = email = created = updated = None
+    for i, raw in enumerate(raw_lines):
+        line = raw.decode("utf-8", errors="ignore").rstrip("\r\n")
+        if by_idx is None:
+            if _RE_BORDER.match(line):
+                start = i
+                continue
+            m = RE_BY.match(line)
+            if m:
+                by_idx, by = i, (m.group(2) or "")
+                email = m.group(4).strip("<>") if m.group(4) else None
+        elif created_idx is None:
+            m = RE_CREATED.match(line)
+            if m:
+                created_idx, created = i, m.group(2)
+        elif updated_idx is None:
+            m = RE_UPDATED.match(line)
+            if m:
+                updated_idx, updated = i, m.group(2)
+        elif _RE_BORDER.match(line):
+            end = i + 1
+            break
+    if updated_idx is None:
+        return None
+    framed = (start is not None and start >= by_idx - 5
+              and end is not None and end <= updated_idx + 3)
+    if framed:
+        # Whatever sits between a border and the fields must be a header line too
+        border = raw_lines[start].decode("utf-8", errors="ignore").split()
+        framed = all(_in_frame(raw_lines[i], border)
+                     for i in chain(range(start + 1, by_idx), range(updated_idx + 1, end - 1)))
+    if not framed:
+        start, end = by_idx, updated_idx + 1
+
+    filename = None
+    if start + 3 < by_idx:
+        m = _RE_TEXT.match(raw_lines[start + 3].decode("utf-8", errors="ignore"))
+        filename = m.group(1) if m else None
+
+    byte_start = sum(len(l) for l in raw_lines[:start])
+    return Header(
+        start=start, end=end,
+        byte_start=byte_start,
+        byte_end=byte_start + sum(len(l) for l in raw_lines[start:end]),
+        line_ending="\r\n" if raw_lines[start].endswith(b"\r\n") else "\n",
+        framed=framed, by_idx=by_idx, created_idx=created_idx, updated_idx=updated_idx,
+        filename=filename, by=by, email=email, created=created, updated=updated,
+    )
+
+def copy_tail(src_fd: int, dst_fd: int, offset: int) -> None:
+    """
+    Copy src from `offset` to EOF to dst's current position, inside the
+    kernel where possible (copy_file_range, then sendfile), otherwise in
+    COPY_CHUNK pieces, so memory use does not grow with the file size.
+    """
+    remaining = os.fstat(src_fd).st_size - offset
+    for name in ("copy_file_range", "sendfile"):
+        if remaining <= 0 or not hasattr(os, name):
+            continue
+        try:
+            while remaining > 0:
+                if name == "copy_file_range":
+                    n = os.copy_file_range(src_fd, dst_fd, remaining, offset)
+                else:
+                    n = os.sendfile(dst_fd, src_fd, offset, remaining)
+                if n == 0:
+                    return  # file shrank under us
+                offset += n
+                remaining -= n
+            return
+        except OSError:
+            continue  # unsupported here (e.g. cross-device); try the next way
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    while True:
+        chunk = os.read(src_fd, COPY_CHUNK)
+        if not chunk:
+            return
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+def patch_in_place(path: str, data: bytes, offset: int = 0, fsync: bool = False) -> None:
+    """
+    Overwrite `data` at `offset` without truncating the file, so only the
+    patched byte range is written.
+    """
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        view = memoryview(data)
+        while view:
+            if hasattr(os, "pwrite"):
+                n = os.pwrite(fd, view, offset)
+            else:
+                os.lseek(fd, offset, os.SEEK_SET)
+                n = os.write(fd, view)
+            view = view[n:]
+            offset += n
+        if fsync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _fill(f, parts: Iterable[bytes], path: str, tail_offset: Optional[int]) -> None:
+    """Write `parts` to `f`, then the original's bytes from `tail_offset` on, if given."""
+    for part in parts:
+        f.write(part)
+    f.flush()
+    if tail_offset is not None:
+        with open(path, "rb") as src:
+            copy_tail(src.fileno(), f.fileno(), tail_offset)
+
+def _overwrite(path: str, src_fd: int, fsync: bool) -> None:
+    """Copy all of `src_fd` over `path` in place, keeping its inode."""
+    with open(path, "r+b") as dst:
+        copy_tail(src_fd, dst.fileno(), 0)
+        dst.truncate()
+        if fsync:
+            os.fsync(dst.fileno())
+
+def write_atomic(
+    path: str,
+    parts: Iterable[bytes],
+    fsync: bool = False,
+    tail_offset: Optional[int] = None
+) -> None:
+    """
+    Write `parts` to a temp file next to `path` and rename it over `path`,
+    so an interrupted run never leaves a truncated file. Files the caller
+    may not write raise PermissionError. Symlinks are followed, so the link
+    itself stays in place.
+    A rename gives the path a new inode, so it is avoided where it would
+    change more than the contents: for files with other hard links, when
+    the directory is not writable (no temp file can be created next to
+    it), or when the temp file can't be given the original owner. Those
+    files are staged in a temp file and overwritten in place, as before.
+    With `tail_offset`, the original's bytes from that offset on are spliced
+    in after `parts` (see copy_tail) instead of passing through Python.
+    With `fsync`, the data is flushed to disk before the rename.
+    """
+    path = os.path.realpath(path)
+    st = os.stat(path)
+    # The rename only needs a writable directory; don't let it bypass a read-only file
+    if not os.access(path, os.W_OK):
+        raise PermissionError(f"not writable: {path}")
+    tmp = None
+    if st.st_nlink == 1:
+        try:
+            fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".",
+                                       suffix=".tmp", dir=os.path.dirname(path))
+        except OSError:
+            pass  # read-only directory
+    if tmp is None:
+        with tempfile.TemporaryFile() as f:
+            _fill(f, parts, path, tail_offset)
+            _overwrite(path, f.fileno(), fsync)
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            _fill(f, parts, path, tail_offset)
+            if fsync:
+                os.fsync(f.fileno())
+        os.chmod(tmp, stat.S_IMODE(st.st_mode))
+        if hasattr(os, "chown"):
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except OSError:
+                tmp_st = os.stat(tmp)
+                if (tmp_st.st_uid, tmp_st.st_gid) != (st.st_uid, st.st_gid):
+                    # Renaming would hand the file over to us; overwrite it in place instead
+                    with open(tmp, "rb") as src:
+                        _overwrite(path, src.fileno(), fsync)
+                    os.unlink(tmp)
+                    return
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+def fsync_dir(dirpath: str) -> None:
+    """Flush a directory (and so the renames in it) to disk; best-effort."""
+    try:
+        fd = os.open(dirpath, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _write_file(
+    path: str,
+    parts: Iterable[bytes],
+    fsync: str,
+    tail_offset: Optional[int] = None
+) -> None:
+    """
+    Atomic whole-file write. `fsync` is one of FSYNC_MODES: "each" also
+    flushes the directory now, "batch" leaves that to the end of the run.
+    """
+    write_atomic(path, parts, fsync=fsync != "none", tail_offset=tail_offset)
+    if fsync == "each":
+        fsync_dir(os.path.dirname(os.path.realpath(path)))
 
 
 def _find_comment_ender_index(new_line: str) -> int:
     """
     If the line ends with a block comment ender, return its start index,
-    prioritizing the rightmost of '*/' or '-->'.
+    prioritizing the rightmost of '*/' or '-->'. Other styles close the line
+    with their own token ('#', '*)', '//', ...): return where that token starts.
     """
     end_idx = len(new_line)
+    body = new_line.rstrip()
+    if " " in body:
+        end_idx = body.rfind(" ") + 1
     enders = []
     e1 = new_line.rfind("*/")
     if e1 != -1:
@@ -44,26 +385,39 @@ def _find_comment_ender_index(new_line: str) -> int:
         end_idx = max(enders)
     return end_idx
 
-def adjust_width_preserving_tail(old_line: str, new_line: str) -> str:
+def adjust_width_preserving_tail(old_line: str, new_line: str, anchor: Optional[int] = None) -> str:
     """
     Keep overall line length stable by adjusting the last run of spaces
-    before the comment ender (*/ or -->). Best-effort; falls back to new_line.
+    before the comment ender (*/ or -->). With `anchor`, adjust the first
+    run of spaces at or after that index instead, so everything to its
+    right (the ASCII art) keeps its column. Best-effort; falls back to new_line.
     """
     if len(new_line) == len(old_line):
         return new_line
 
-    end_idx = _find_comment_ender_index(new_line)
     diff = len(new_line) - len(old_line)
 
     run_start = None
     run_end = None
-    i = end_idx - 1
-    while i >= 0 and new_line[i] == ' ':
-        run_end = i if run_end is None else run_end
-        run_start = i
-        i -= 1
+    if anchor is None:
+        end_idx = _find_comment_ender_index(new_line)
+        i = end_idx - 1
+        while i >= 0 and new_line[i] == ' ':
+            run_end = i if run_end is None else run_end
+            run_start = i
+            i -= 1
+    else:
+        i = anchor
+        while i < len(new_line) and new_line[i] != ' ':
+            i += 1
+        while i < len(new_line) and new_line[i] == ' ':
+            run_start = i if run_start is None else run_start
+            run_end = i
+            i += 1
 
     if run_start is None:
+        if anchor is not None:
+            return adjust_width_preserving_tail(old_line, new_line)
         return new_line  # nowhere to flex
 
     run_len = run_end - run_start + 1
@@ -71,6 +425,10 @@ def adjust_width_preserving_tail(old_line: str, new_line: str) -> str:
         # need to remove diff spaces
         if run_len > diff:
             return new_line[:run_start] + (' ' * (run_len - diff)) + new_line[run_end+1:]
+        if anchor is not None and run_len > 1:
+            # squeeze this gap to one space, take the rest before the ender
+            new_line = new_line[:run_start] + ' ' + new_line[run_end+1:]
+            return adjust_width_preserving_tail(old_line, new_line)
         return new_line
     # need to add -diff spaces
     return new_line[:run_start] + (' ' * (run_len - diff)) + new_line[run_end+1:]
@@ -88,106 +446,540 @@ def update_by_line(line: str, name: str, email: Optional[str], preserve_width: b
     by_val = name if not email else f"{name} <{email}>"
     tail = rest if old_email else (gap + rest)
     new_line = f"{left}{by_val}{tail}"
-    new_line = adjust_width_preserving_tail(line_body, new_line) if preserve_width else new_line
+    anchor = len(left) + len(by_val)
+    new_line = adjust_width_preserving_tail(line_body, new_line, anchor) if preserve_width else new_line
     return new_line + line_ending
 
-def update_dt_line(line: str, re_obj: re.Pattern, new_dt: datetime, preserve_width: bool) -> str:
+def update_dt_line(
+    line: str,
+    re_obj: re.Pattern,
+    new_dt: datetime,
+    preserve_width: bool,
+    name: Optional[str] = None
+) -> str:
+    """
+    Rewrite the date of a Created/Updated line (and, given `name`, the
+    "by <name>" after it).
+    """
     line_ending = "\r\n" if line.endswith("\r\n") else ("\n" if line.endswith("\n") else "")
     line_body = line[:-len(line_ending)] if line_ending else line
     m = re_obj.match(line_body)
     if not m:
         return line
     left, _old_dt, tail = m.groups()
-    new_line = f"{left}{format_42(new_dt)}{tail}"
-    new_line = adjust_width_preserving_tail(line_body, new_line) if preserve_width else new_line
+    head = f"{left}{format_42(new_dt)}"
+    rest = ""
+    tm = _RE_BY_TAIL.match(tail)
+    if tm:
+        head += tm.group(1) + (name if name is not None else tm.group(2))
+        rest = tm.group(3)
+    else:
+        rest = tail
+    new_line = head + rest
+    new_line = adjust_width_preserving_tail(line_body, new_line, len(head)) if preserve_width else new_line
     return new_line + line_ending
 
-def collect_files(root: str, exts: Optional[List[str]], recursive: bool) -> List[str]:
+class FileEntry(NamedTuple):
+    """A discovered file with the stat info captured during the walk."""
+    path: str
+    mtime: float
+    size: int
+
+class ExcludeMatcher:
+    """
+    Glob patterns (from --exclude and .headerignore) compiled into one regex
+    for basenames and one for root-relative paths.
+      - "name" / "*.min.js"   match the basename at any depth
+      - "dir/sub" / "/build"  match the path relative to the scan root
+      - a trailing "/" only matches directories
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        name_res: List[str] = []
+        path_res: List[str] = []
+        for pat in patterns:
+            pat = pat.strip()
+            if not pat or pat.startswith("#"):
+                continue
+            dir_only = pat.endswith("/")
+            pat = pat.rstrip("/")
+            if pat.startswith("./"):
+                pat = pat[2:]
+            if not pat:
+                continue
+            anchored = "/" in pat
+            rx = fnmatch.translate(pat.lstrip("/") + ("/" if dir_only else ""))
+            (path_res if anchored else name_res).append(rx)
+        self._name_re = re.compile("|".join(name_res)) if name_res else None
+        self._path_re = re.compile("|".join(path_res)) if path_res else None
+
+    def __bool__(self) -> bool:
+        return self._name_re is not None or self._path_re is not None
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        """`rel_path` uses "/" separators and is relative to the scan root."""
+        name = rel_path.rsplit("/", 1)[-1]
+        for subject_re, subject in ((self._name_re, name), (self._path_re, rel_path)):
+            if subject_re is None:
+                continue
+            if subject_re.match(subject) or (is_dir and subject_re.match(subject + "/")):
+                return True
+        return False
+
+def load_ignore_file(path: str) -> List[str]:
+    """Read glob patterns from an ignore file (missing file -> no patterns)."""
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+_POSIX_CLASSES = {
+    "alnum": "a-zA-Z0-9", "alpha": "a-zA-Z", "blank": " \\t", "cntrl": "\\x00-\\x1f\\x7f",
+    "digit": "0-9", "graph": "\\x21-\\x7e", "lower": "a-z", "print": "\\x20-\\x7e",
+    "punct": "\\x21-\\x2f\\x3a-\\x40\\x5b-\\x60\\x7b-\\x7e", "space": " \\t\\n\\r\\f\\v",
+    "upper": "A-Z", "xdigit": "0-9A-Fa-f",
+}
+
+def _class_char(c: str) -> str:
+    return "\\" + c if c in "\\]^-[&~|" else c
+
+def _bracket_to_regex(pat: str, i: int) -> Optional[Tuple[str, int]]:
+    """
+    Translate the bracket expression starting at pat[i] == "[" into a regex
+    class; returns (regex, index after "]"), or None if it is never closed.
+    Like git, a class never matches "/". Raises re.error for an unknown
+    [:class:] name; invalid ranges such as "z-a" fail when compiled.
+    """
+    j, n = i + 1, len(pat)
+    negate = j < n and pat[j] in "!^"
+    if negate:
+        j += 1
+    parts: List[str] = []
+    first = True
+    while j < n and (pat[j] != "]" or first):
+        first = False
+        if pat.startswith("[:", j):
+            end = pat.find(":]", j + 2)
+            if end != -1:
+                name = pat[j + 2:end]
+                if name not in _POSIX_CLASSES:
+                    raise re.error(f"unknown character class [:{name}:]")
+                parts.append(_POSIX_CLASSES[name])
+                j = end + 2
+                continue
+        c = pat[j]
+        if c == "\\" and j + 1 < n:
+            j += 1
+            c = pat[j]
+        if j + 2 < n and pat[j + 1] == "-" and pat[j + 2] != "]":
+            hi = pat[j + 2]
+            if hi == "\\" and j + 3 < n:
+                hi = pat[j + 3]
+                j += 1
+            parts.append(_class_char(c) + "-" + _class_char(hi))
+            j += 3
+            continue
+        parts.append(_class_char(c))
+        j += 1
+    if j >= n:
+        return None
+    body = "".join(parts)
+    return ("[^/" + body + "]" if negate else "(?!/)[" + body + "]"), j + 1
+
+def _glob_to_regex(pat: str) -> str:
+    """Translate one gitignore glob ('*', '?', '[...]', '**') to a regex body."""
+    out: List[str] = []
+    i, n = 0, len(pat)
+    while i < n:
+        c = pat[i]
+        if c == "*":
+            if pat.startswith("**/", i):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pat.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            bracket = _bracket_to_regex(pat, i)
+            if bracket is None:
+                out.append(re.escape(c))
+            else:
+                cls, i = bracket
+                out.append(cls)
+                continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pat[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+def _compile_gitignore_line(line: str, base: str) -> Optional[Tuple[str, bool]]:
+    """
+    Turn one .gitignore line into (regex, negate). The regex matches paths
+    relative to the repository top; directories are matched with a trailing "/".
+    `base` is the directory holding the .gitignore ("" or "a/b/").
+    """
+    if not line.strip() or line.startswith("#"):
+        return None
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "  # escaped trailing space
+    line = stripped
+    negate = line.startswith("!")
+    if negate:
+        line = line[1:]
+    elif line.startswith(("\\!", "\\#")):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    try:
+        body = _glob_to_regex(line.lstrip("/"))
+        rx = re.escape(base) + ("" if anchored else "(?:.*/)?") + body + ("/" if dir_only else "/?")
+        re.compile(rx)
+    except re.error:
+        return None  # git ignores patterns it cannot parse, and so do we
+    return rx, negate
+
+class GitIgnore:
+    """
+    The .gitignore rules in effect for one directory: everything inherited
+    from its parents plus its own .gitignore, compiled once. Later (deeper)
+    rules win, as in git. Without negations the rules collapse into one regex.
+    """
+
+    def __init__(self, rules: Tuple[Tuple[str, bool], ...], prefix: str) -> None:
+        self._rules = rules
+        self._prefix = prefix  # scan root relative to the repository top
+        if any(neg for _rx, neg in rules):
+            self._any_re = None
+            self._ordered = [(re.compile(rx + r"\Z"), neg) for rx, neg in reversed(rules)]
+        else:
+            self._any_re = re.compile("(?:" + "|".join(rx for rx, _neg in rules) + r")\Z")
+            self._ordered = []
+
+    @classmethod
+    def for_root(cls, root: str) -> "GitIgnore":
+        """
+        Rules for `root`: .git/info/exclude and the .gitignore files of the
+        directories between the repository top and `root` (exclusive).
+        `root` and its subdirectories are loaded by child() during the walk.
+        """
+        root = os.path.abspath(root)
+        top = root
+        while not os.path.exists(os.path.join(top, ".git")):
+            parent = os.path.dirname(top)
+            if parent == top:
+                top = root  # not inside a repository
+                break
+            top = parent
+        rel_root = os.path.relpath(root, top).replace(os.sep, "/")
+        prefix = "" if rel_root == "." else rel_root + "/"
+
+        rules: List[Tuple[str, bool]] = [(r"(?:.*/)?\.git/?", False)]  # never descend into .git
+        sources = [(os.path.join(top, ".git", "info", "exclude"), "")]
+        base = ""
+        for part in prefix.split("/")[:-1]:
+            sources.append((os.path.join(top, base, ".gitignore"), base))
+            base += part + "/"
+        for path, src_base in sources:
+            for line in load_ignore_file(path):
+                rule = _compile_gitignore_line(line, src_base)
+                if rule:
+                    rules.append(rule)
+        return cls(tuple(rules), prefix)
+
+    def child(self, gitignore_path: str, rel_dir: str) -> "GitIgnore":
+        """Rules for a subdirectory (`rel_dir` relative to the scan root) with its own .gitignore."""
+        base = self._prefix + rel_dir
+        new_rules = [r for r in (_compile_gitignore_line(l, base)
+                                 for l in load_ignore_file(gitignore_path)) if r]
+        if not new_rules:
+            return self
+        return GitIgnore(self._rules + tuple(new_rules), self._prefix)
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        """`rel_path` uses "/" separators and is relative to the scan root."""
+        subject = self._prefix + rel_path + ("/" if is_dir else "")
+        if self._any_re is not None:
+            return self._any_re.match(subject) is not None
+        for rx, negate in self._ordered:
+            if rx.match(subject):
+                return not negate
+        return False
+
+def iter_files(
+    root: str,
+    exts: Optional[List[str]],
+    recursive: bool,
+    exclude: Optional[ExcludeMatcher] = None,
+    gitignore: Optional[GitIgnore] = None
+) -> Iterator[FileEntry]:
+    """
+    Walk `root` with os.scandir and yield files as they are found, keeping
+    each file's type/mtime/size from the DirEntry so later filtering and
+    ordering never stat it again.
+    Excluded (and, with `gitignore`, git-ignored) directories are pruned
+    before they are entered.
+    Symlinked directories are not followed (same as os.walk).
+    """
     exts_set = set(e.lower() for e in exts) if exts else None
-    files: List[str] = []
-    if recursive:
-        for dirpath, _dirs, fnames in os.walk(root):
-            for fn in fnames:
-                if not exts_set or os.path.splitext(fn)[1].lower() in exts_set:
-                    files.append(os.path.join(dirpath, fn))
-    else:
-        for fn in os.listdir(root):
-            p = os.path.join(root, fn)
-            if os.path.isfile(p) and (not exts_set or os.path.splitext(fn)[1].lower() in exts_set):
-                files.append(p)
-    # default ordering: case-insensitive name
-    return sorted(files, key=lambda p: p.lower())
+    stack = [(root, "", gitignore)]
+    while stack:
+        dirpath, rel_dir, ignore = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        if ignore is not None and any(e.name == ".gitignore" for e in entries):
+            ignore = ignore.child(os.path.join(dirpath, ".gitignore"), rel_dir)
+        for entry in entries:
+            rel = rel_dir + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if (recursive
+                            and not (exclude and exclude.matches(rel, True))
+                            and not (ignore and ignore.matches(rel, True))):
+                        stack.append((entry.path, rel + "/", ignore))
+                    continue
+                if not entry.is_file():
+                    continue
+                if exts_set and os.path.splitext(entry.name)[1].lower() not in exts_set:
+                    continue
+                if exclude and exclude.matches(rel, False):
+                    continue
+                if ignore and ignore.matches(rel, False):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            yield FileEntry(entry.path, st.st_mtime, st.st_size)
+
+def _git_paths(root: str, *git_args: str) -> List[str]:
+    """Run a git command in `root` that prints NUL-separated paths relative to it."""
+    out = subprocess.run(
+        ["git", *git_args], cwd=root, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    ).stdout
+    return [os.fsdecode(p) for p in out.split(b"\0") if p]
+
+def _entries_for_paths(
+    root: str,
+    rel_paths: Iterable[str],
+    exts: Optional[List[str]],
+    recursive: bool,
+    exclude: Optional[ExcludeMatcher] = None
+) -> Iterator[FileEntry]:
+    """Filter root-relative paths like iter_files does, stat'ing only the survivors."""
+    exts_set = set(e.lower() for e in exts) if exts else None
+    excluded_dirs = {}  # rel dir -> bool, so each directory is matched once
+    for rel in rel_paths:
+        parts = rel.split("/")
+        if len(parts) > 1 and not recursive:
+            continue
+        if exts_set and os.path.splitext(parts[-1])[1].lower() not in exts_set:
+            continue
+        if exclude:
+            skip = False
+            for depth in range(1, len(parts)):
+                d = "/".join(parts[:depth])
+                if d not in excluded_dirs:
+                    excluded_dirs[d] = exclude.matches(d, True)
+                if excluded_dirs[d]:
+                    skip = True
+                    break
+            if skip or exclude.matches(rel, False):
+                continue
+        path = os.path.join(root, *parts)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # deleted in the worktree
+        if stat.S_ISREG(st.st_mode):
+            yield FileEntry(path, st.st_mtime, st.st_size)
+
+def iter_git_files(
+    root: str,
+    exts: Optional[List[str]],
+    recursive: bool,
+    exclude: Optional[ExcludeMatcher] = None
+) -> Iterator[FileEntry]:
+    """
+    Tracked files under `root`, read from the git index (`git ls-files`)
+    instead of walking the filesystem. Raises if `root` is not in a repository.
+    """
+    rel_paths = _git_paths(root, "ls-files", "-z", "--cached")
+    return _entries_for_paths(root, rel_paths, exts, recursive, exclude)
+
+def iter_changed_files(
+    root: str,
+    exts: Optional[List[str]],
+    recursive: bool,
+    exclude: Optional[ExcludeMatcher] = None,
+    since: Optional[str] = None,
+    staged: bool = False
+) -> Iterator[FileEntry]:
+    """
+    Files under `root` that git reports as added/copied/modified/renamed:
+    staged changes (`staged`), working-tree changes since `since`, or both
+    (staged changes since `since`). Working-tree runs also include untracked,
+    non-ignored files, since new files are the likeliest to lack a header.
+    Raises if `root` is not in a repository, and ValueError if `since`
+    looks like an option; otherwise it is resolved to a commit hash first,
+    so git never reads it as anything but a revision.
+    """
+    git_args = ["diff", "--name-only", "-z", "--relative", "--diff-filter=ACMR"]
+    if staged:
+        git_args.append("--cached")
+    if since:
+        if since.startswith("-"):
+            raise ValueError(f"not a revision: {since}")
+        commit = subprocess.run(
+            ["git", "rev-parse", "--verify", "--quiet", since + "^{commit}"],
+            cwd=root, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        ).stdout.decode("ascii").strip()
+        git_args.extend([commit, "--"])
+    rel_paths = _git_paths(root, *git_args)
+    if not staged:
+        rel_paths = list(dict.fromkeys(
+            rel_paths + _git_paths(root, "ls-files", "-z", "--others", "--exclude-standard")
+        ))
+    return _entries_for_paths(root, rel_paths, exts, recursive, exclude)
+
+def sort_files(entries: Iterable[FileEntry], order: str = "name") -> List[FileEntry]:
+    """Case-insensitive name order; with order="mtime", oldest first (ties by name)."""
+    files = sorted(entries, key=lambda e: e.path.lower())
+    if order == "mtime":
+        files.sort(key=lambda e: e.mtime)
+    return files
+
+def scan_files(
+    root: str,
+    exts: Optional[List[str]],
+    recursive: bool,
+    exclude: Optional[ExcludeMatcher] = None,
+    gitignore: Optional[GitIgnore] = None,
+    order: str = "name"
+) -> List[FileEntry]:
+    return sort_files(iter_files(root, exts, recursive, exclude, gitignore), order)
+
+def collect_files(
+    root: str,
+    exts: Optional[List[str]],
+    recursive: bool,
+    exclude: Optional[ExcludeMatcher] = None,
+    gitignore: Optional[GitIgnore] = None
+) -> List[str]:
+    return [e.path for e in scan_files(root, exts, recursive, exclude, gitignore)]
+
+def _styles_table(*groups: Tuple[Tuple[str, ...], Tuple[str, str, str]]) -> dict:
+    return {key: style for keys, style in groups for key in keys}
+
+# Comment styles from the 42 header vim script, keyed by lowercase extension
+_STYLE_BY_EXT = _styles_table(
+    ((".c", ".h", ".cc", ".hh", ".cpp", ".hpp", ".tpp", ".ipp", ".cxx",
+      ".go", ".rs", ".php", ".java", ".kt", ".kts"), ("/*", "*/", "*")),
+    ((".htm", ".html", ".xml"), ("<!--", "-->", "*")),
+    ((".js", ".ts"), ("//", "//", "*")),
+    ((".tex",), ("%", "%", "*")),
+    ((".ml", ".mli", ".mll", ".mly"), ("(*", "*)", "*")),
+    ((".vim",), ('"', '"', "*")),
+    ((".el", ".asm"), (";", ";", "*")),
+    ((".f90", ".f95", ".f03", ".f", ".for"), ("!", "!", "/")),
+    ((".lua",), ("--", "--", "-")),
+    ((".py",), ("#", "#", "*")),
+)
+# ... and by lowercase basename, for files the script matches by name
+_STYLE_BY_NAME = _styles_table(
+    (("vimrc", ".vimrc", "_vimrc"), ('"', '"', "*")),
+    (("emacs", ".emacs"), (";", ";", "*")),
+)
+_DEFAULT_STYLE = ("#", "#", "*")
+
+@lru_cache(maxsize=4096)
+def _style_for_basename(basename: str) -> Tuple[str, str, str]:
+    basename = basename.lower()
+    style = _STYLE_BY_NAME.get(basename)
+    if style is None:
+        style = _STYLE_BY_EXT.get(os.path.splitext(basename)[1], _DEFAULT_STYLE)
+    return style
 
 def comment_style_for_ext(filename: str) -> Tuple[str, str, str]:
     """
     Return (start, end, fill) based on 42 header vim script rules.
     Default is hash-style.
     """
-    types = [
-        (r"\.c$|\.h$|\.cc$|\.hh$|\.cpp$|\.hpp$|\.tpp$|\.ipp$|\.cxx$|\.go$|\.rs$|\.php$|\.java$|\.kt$|\.kts$",
-         ("/*", "*/", "*")),
-        (r"\.htm$|\.html$|\.xml$", ("<!--", "-->", "*")),
-        (r"\.js$|\.ts$", ("//", "//", "*")),
-        (r"\.tex$", ("%", "%", "*")),
-        (r"\.ml$|\.mli$|\.mll$|\.mly$", ("(*", "*)", "*")),
-        (r"\.vim$|\\vimrc$", ('"', '"', "*")),
-        (r"\.el$|\\emacs$|\.asm$", (";", ";", "*")),
-        (r"\.f90$|\.f95$|\.f03$|\.f$|\.for$", ("!", "!", "/")),
-        (r"\.lua$", ("--", "--", "-")),
-        (r"\.py$", ("#", "#", "*")),
-    ]
-    for pattern, style in types:
-        if re.search(pattern, filename, re.IGNORECASE):
-            return style
-    return ("#", "#", "*")
+    return _style_for_basename(os.path.basename(filename))
 
-def build_header_block(
-    filename: str,
-    name: str,
-    email: Optional[str],
-    created_dt: datetime,
-    updated_dt: datetime,
-    style: Tuple[str, str, str] = ("/*", "*/", "*"),
-    width: int = 80,
-    margin: int = 5
-) -> List[str]:
+_ASCIIART = (
+    "        :::      ::::::::",
+    "      :+:      :+:    :+:",
+    "    +:+ +:+         +:+  ",
+    "  +#+  +:+       +#+     ",
+    "+#+#+#+#+#+   +#+        ",
+    "     #+#    #+#          ",
+    "    ###   ########.fr    ",
+)
+_DT_SLOT = "\0" * 19  # stands in for a format_42() stamp in templates
+
+def _text_line(style: Tuple[str, str, str], left: str, right: str, width: int, margin: int) -> str:
+    start, end, _fill = style
+    max_left = width - margin * 2 - len(right)
+    left = left[:max_left]
+    spaces = max_left - len(left)
+    if spaces < 0:
+        spaces = 0
+    return (
+        start
+        + (" " * (margin - len(start)))
+        + left
+        + (" " * spaces)
+        + right
+        + (" " * (margin - len(end)))
+        + end
+    )
+
+class _HeaderTemplate(NamedTuple):
     """
-    Generate a robust 42-style header block.
-    Matches the 42 vim script layout and spacing.
+    Pre-rendered header for one style and identity: the 11 lines, with the
+    filename line and the Created/Updated dates left as slots. Each slot is
+    a (before, after) pair to splice the per-file text between.
     """
-    created = format_42(created_dt)
-    updated = format_42(updated_dt)
+    lines: Tuple[str, ...]
+    filename_slot: Tuple[str, str]
+    filename_width: int
+    created_slot: Optional[Tuple[str, str]]  # None if the date got truncated
+    updated_slot: Optional[Tuple[str, str]]
+
+@lru_cache(maxsize=64)
+def _header_template(
+    style: Tuple[str, str, str],
+    name: str,
+    email: Optional[str],
+    width: int,
+    margin: int
+) -> _HeaderTemplate:
     by_line = f"By: {name}" + (f" <{email}>" if email else "")
 
     start, end, fill = style
-    asciiart = [
-        "        :::      ::::::::",
-        "      :+:      :+:    :+:",
-        "    +:+ +:+         +:+  ",
-        "  +#+  +:+       +#+     ",
-        "+#+#+#+#+#+   +#+        ",
-        "     #+#    #+#          ",
-        "    ###   ########.fr    ",
-    ]
 
     def ascii_line(n: int) -> str:
-        return asciiart[n - 3]
+        return _ASCIIART[n - 3]
 
     def text_line(left: str, right: str) -> str:
-        max_left = width - margin * 2 - len(right)
-        left = left[:max_left]
-        spaces = max_left - len(left)
-        if spaces < 0:
-            spaces = 0
-        return (
-            start
-            + (" " * (margin - len(start)))
-            + left
-            + (" " * spaces)
-            + right
-            + (" " * (margin - len(end)))
-            + end
-        )
+        return _text_line(style, left, right, width, margin)
 
     def line(n: int) -> str:
         if n in (1, 11):
@@ -197,16 +989,62 @@ def build_header_block(
         if n in (3, 5, 7):
             return text_line("", ascii_line(n))
         if n == 4:
-            return text_line(os.path.basename(filename), ascii_line(n))
+            return text_line("", ascii_line(n))  # filename goes in filename_slot
         if n == 6:
             return text_line(by_line, ascii_line(n))
         if n == 8:
-            return text_line(f"Created: {created} by {name}", ascii_line(n))
+            return text_line(f"Created: {_DT_SLOT} by {name}", ascii_line(n))
         if n == 9:
-            return text_line(f"Updated: {updated} by {name}", ascii_line(n))
+            return text_line(f"Updated: {_DT_SLOT} by {name}", ascii_line(n))
         return text_line("", "")
 
-    return [line(i) for i in range(1, 12)]
+    def dt_slot(text: str) -> Optional[Tuple[str, str]]:
+        i = text.find(_DT_SLOT)
+        return (text[:i], text[i + len(_DT_SLOT):]) if i != -1 else None
+
+    lines = tuple(line(i) for i in range(1, 12))
+    right = ascii_line(4)
+    return _HeaderTemplate(
+        lines=lines,
+        filename_slot=(start + (" " * (margin - len(start))),
+                       right + (" " * (margin - len(end))) + end),
+        filename_width=width - margin * 2 - len(right),
+        created_slot=dt_slot(lines[7]),
+        updated_slot=dt_slot(lines[8]),
+    )
+
+def build_header_block(
+    filename: str,
+    name: str,
+    email: Optional[str],
+    created_dt: datetime,
+    updated_dt: datetime,
+    style: Tuple[str, str, str] = ("/*", "*/", "*"),
+    width: int = 80,
+    margin: int = 5
+) -> List[str]:
+    """
+    Generate a robust 42-style header block.
+    Matches the 42 vim script layout and spacing. The invariant lines come
+    from a template cached per style/identity; only the filename and the
+    two dates are spliced in per file.
+    """
+    tpl = _header_template(style, name, email, width, margin)
+    out = list(tpl.lines)
+
+    base = os.path.basename(filename)[:tpl.filename_width]
+    before, after = tpl.filename_slot
+    out[3] = before + base + (" " * max(tpl.filename_width - len(base), 0)) + after
+
+    for idx, label, slot, dt in ((7, "Created", tpl.created_slot, created_dt),
+                                 (8, "Updated", tpl.updated_slot, updated_dt)):
+        if slot is not None:
+            out[idx] = slot[0] + format_42(dt) + slot[1]
+        else:
+            # date cut off by a narrow width: render the line in full
+            out[idx] = _text_line(style, f"{label}: {format_42(dt)} by {name}",
+                                  _ASCIIART[idx - 2], width, margin)
+    return out
 
 def insert_header_if_missing(
     path: str,
@@ -214,21 +1052,22 @@ def insert_header_if_missing(
     email: Optional[str],
     created_dt: datetime,
     updated_dt: datetime,
-    dry_run: bool
+    dry_run: bool,
+    head: Optional[Tuple[bytes, bool]] = None,
+    fsync: str = "none"
 ) -> Tuple[bool, str]:
     """
     If the file lacks a 42 header, insert one at the top.
     For scripts with a shebang, place header after the shebang.
+    `head` is a (prefix, at_eof) pair from read_head, if already read.
+    The file is replaced atomically; `fsync` is one of FSYNC_MODES.
     """
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
+        prefix, at_eof = head if head is not None else read_head(path)
     except Exception:
         return False, "read-fail"
 
-    lines = content.splitlines(keepends=True)
-    head = lines[:HEADER_SCAN_LINES]
-    if looks_like_42_header(head):
+    if has_42_header(prefix, at_eof):
         return False, "already-has-header"
 
     style = comment_style_for_ext(path)
@@ -242,21 +1081,74 @@ def insert_header_if_missing(
     )
     header_text = "".join(l if l.endswith("\n") else l + "\n" for l in header_lines)
 
+    raw_lines = head_lines(prefix, at_eof)
     insert_idx = 0
     # Preserve shebang on first line for hash-style languages
-    if lines and lines[0].startswith("#!") and style == "hash":
+    if raw_lines and raw_lines[0].startswith(b"#!") and style == "hash":
         insert_idx = 1
 
-    new_content = "".join(lines[:insert_idx]) + header_text + "".join(lines[insert_idx:])
     if not dry_run:
+        keep = b"".join(raw_lines[:insert_idx])
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(new_content)
+            header = header_text.encode("utf-8")
+            if at_eof:
+                _write_file(path, (keep, header, prefix[len(keep):]), fsync)
+            else:
+                _write_file(path, (keep, header), fsync, tail_offset=len(keep))
         except Exception:
             return False, "write-fail"
 
     return True, "inserted"
 
+def _diff_span(old: bytes, new: bytes) -> Tuple[int, int]:
+    """[lo, hi) covering every byte that differs between two equal-length buffers."""
+    lo, hi = 0, len(new)
+    while lo < hi and old[lo] == new[lo]:
+        lo += 1
+    while hi > lo and old[hi - 1] == new[hi - 1]:
+        hi -= 1
+    return lo, hi
+
+def _update_header_fields(
+    raw_lines: List[bytes],
+    header: Header,
+    name: str,
+    email: Optional[str],
+    created_dt: datetime,
+    updated_dt: datetime,
+    preserve_width: bool,
+    updated_only: bool = False
+) -> Optional[bytes]:
+    """
+    Header bytes with only the By/Created/Updated values rewritten in place.
+    With `updated_only`, just the Updated date changes (a same-width edit);
+    the existing Created stamp and names are left alone.
+    Returns None if, with `preserve_width`, a value does not fit in its
+    line's gaps, so the caller can regenerate the block instead.
+    """
+    lines = list(raw_lines[header.start:header.end])
+    overflow = False
+
+    def patch(idx: int, update) -> None:
+        nonlocal overflow
+        i = idx - header.start
+        # surrogateescape round-trips any non-UTF-8 bytes on the line
+        old = lines[i].decode("utf-8", "surrogateescape")
+        new = update(old)
+        if len(new) > len(old):
+            overflow = True
+        lines[i] = new.encode("utf-8", "surrogateescape")
+
+    if updated_only:
+        patch(header.updated_idx, lambda l: update_dt_line(l, RE_UPDATED, updated_dt, preserve_width))
+    else:
+        patch(header.by_idx, lambda l: update_by_line(l, name, email, preserve_width))
+        patch(header.created_idx, lambda l: update_dt_line(l, RE_CREATED, created_dt, preserve_width, name))
+        patch(header.updated_idx, lambda l: update_dt_line(l, RE_UPDATED, updated_dt, preserve_width, name))
+    if overflow and preserve_width:
+        return None
+    return b"".join(lines)
+
 def process_file_update_existing(
     path: str,
     name: str,
@@ -264,87 +1156,491 @@ def process_file_update_existing(
     created_dt: datetime,
     updated_dt: datetime,
     preserve_width: bool,
-    dry_run: bool
+    dry_run: bool,
+    head: Optional[Tuple[bytes, bool]] = None,
+    fsync: str = "none",
+    update_mode: str = "block",
+    header: Optional[Header] = None
 ) -> Tuple[bool, str]:
     """
     Update existing header fields (By/Created/Updated).
-    Returns (changed, status). If no header present, returns (False, "no-42-header").
+    Returns (changed, status). If no header present, returns (False, "no-42-header");
+    if the regenerated header is byte-identical, nothing is written and it
+    returns (False, "unchanged"). Only the header's own bytes (as located by
+    parse_header) are replaced; anything above it, such as a shebang, is kept.
+    `head` is a (prefix, at_eof) pair from read_head, if already read, and
+    `header` its parse_header result, if already parsed.
+    `update_mode` is one of UPDATE_MODES: "block" regenerates the whole
+    header, "fields" only rewrites the By/Created/Updated values in the
+    existing lines (see update_by_line/update_dt_line), "updated" only
+    rewrites the Updated date and keeps the existing Created stamp. When a
+    new value would widen a line under `preserve_width`, the block is
+    regenerated (and truncated to width) instead. A header without border
+    lines (not `framed`) is only ever patched field by field; regenerating
+    it reports "parse-fail".
+    Same-size headers are patched in place (just the bytes that differ),
+    anything else replaces the file atomically; `fsync` is one of FSYNC_MODES.
     """
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()
+        prefix, at_eof = head if head is not None else read_head(path)
     except Exception:
         return False, "read-fail"
 
-    if not lines:
+    if not prefix:
         return False, "empty"
 
-    if not looks_like_42_header(lines[:HEADER_SCAN_LINES]):
+    if not has_42_header(prefix, at_eof):
         return False, "no-42-header"
+    raw_lines = head_lines(prefix, at_eof)
+    if header is None:
+        header = parse_header(raw_lines)
+        if header is None:
+            return False, "parse-fail"
 
-    style = comment_style_for_ext(path)
-    header_lines = build_header_block(
-        filename=path,
-        name=name,
-        email=email,
-        created_dt=created_dt,
-        updated_dt=updated_dt,
-        style=style,
-    )
-    line_ending = "\r\n" if lines[0].endswith("\r\n") else "\n"
-    new_lines = [hl + line_ending for hl in header_lines] + lines[len(header_lines):]
+    header_bytes = None
+    if update_mode in ("fields", "updated"):
+        header_bytes = _update_header_fields(
+            raw_lines, header, name, email, created_dt, updated_dt, preserve_width,
+            updated_only=update_mode == "updated"
+        )
+    if header_bytes is None:
+        if not header.framed:
+            # No borders to replace between; a new block would land amid other lines
+            return False, "parse-fail"
+        style = comment_style_for_ext(path)
+        header_lines = build_header_block(
+            filename=path,
+            name=name,
+            email=email,
+            created_dt=created_dt,
+            updated_dt=updated_dt,
+            style=style,
+        )
+        header_bytes = "".join(hl + header.line_ending for hl in header_lines).encode("utf-8")
+    old_bytes = prefix[header.byte_start:header.byte_end]
+    above = prefix[:header.byte_start]
+    if header_bytes == old_bytes:
+        return False, "unchanged"
     if not dry_run:
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                f.writelines(new_lines)
+            if preserve_width and len(header_bytes) == len(old_bytes):
+                # Same-size header: patch only the differing bytes, leave the rest alone
+                lo, hi = _diff_span(old_bytes, header_bytes)
+                patch_in_place(path, header_bytes[lo:hi], header.byte_start + lo,
+                               fsync=fsync != "none")
+            elif at_eof:
+                _write_file(path, (above, header_bytes, prefix[header.byte_end:]), fsync)
+            else:
+                _write_file(path, (above, header_bytes), fsync, tail_offset=header.byte_end)
         except Exception:
             return False, "write-fail"
 
     return True, "ok"
 
+def updated_after_created(header: Header, created_dt: datetime, updated_dt: datetime) -> datetime:
+    """
+    For update mode "updated": the planned Updated stamp, moved later when
+    the header's kept Created stamp would come after it, so Updated stays
+    one planned work interval (updated_dt - created_dt) past Created,
+    capped at the end of Created's day.
+    """
+    if header.created is None:
+        return updated_dt
+    try:
+        kept = datetime.strptime(" ".join(header.created.split()), "%Y/%m/%d %H:%M:%S")
+    except ValueError:
+        return updated_dt
+    earliest = min(kept + (updated_dt - created_dt), kept.replace(hour=23, minute=59, second=59))
+    return max(updated_dt, earliest)
+
+def process_file(
+    path: str,
+    name: str,
+    email: Optional[str],
+    created_dt: datetime,
+    updated_dt: datetime,
+    preserve_width: bool,
+    dry_run: bool,
+    add_missing: bool,
+    size: Optional[int] = None,
+    fsync: str = "none",
+    update_mode: str = "block",
+    head: Optional[Tuple[bytes, bool]] = None,
+    header: Optional[Header] = None
+) -> Tuple[str, str]:
+    """
+    Per-file pipeline: read the head once, then update the existing header
+    or insert a new one from the same buffer.
+    Returns (action, status); action is "updated", "inserted", "unchanged"
+    or "skipped".
+    `size` is the file size from the walk, if known (empty files are not opened).
+    `head` is a (prefix, at_eof) pair from read_head, if already read, and
+    `header` its parse_header result, if already parsed.
+    """
+    if size == 0:
+        return "skipped", "empty"
+    if head is None:
+        try:
+            head = read_head(path)
+        except Exception:
+            return "skipped", "read-fail"
+
+    changed, status = process_file_update_existing(
+        path, name, email, created_dt, updated_dt, preserve_width, dry_run,
+        head=head, fsync=fsync, update_mode=update_mode, header=header
+    )
+    if changed:
+        return "updated", status
+    if status == "unchanged":
+        return "unchanged", status
+    if status == "no-42-header" and add_missing:
+        did_insert, istatus = insert_header_if_missing(
+            path, name, email, created_dt, updated_dt, dry_run, head=head, fsync=fsync
+        )
+        return ("inserted" if did_insert else "skipped"), istatus
+    return "skipped", status
+
+# ---------- State cache ----------
+
+class FileState(NamedTuple):
+    """What the tool last left in a file: its size, mtime and header hash."""
+    size: int
+    mtime: float
+    header_hash: str
+
+def header_hash(prefix: bytes, at_eof: bool) -> str:
+    """Hash of the first HEADER_LINES lines of a file head."""
+    return hashlib.sha1(b"".join(head_lines(prefix, at_eof)[:HEADER_LINES])).hexdigest()
+
+def read_file_state(path: str) -> FileState:
+    st = os.stat(path)
+    return FileState(st.st_size, st.st_mtime, header_hash(*read_head(path)))
+
+def options_fingerprint(opts: "RunOptions") -> str:
+    """Hash of the settings that decide what a header says."""
+    key = repr((opts.name, opts.email, opts.update_mode, opts.preserve_width))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+class StateCache:
+    """
+    SQLite table of FileState keyed by absolute path, so files the tool
+    wrote on a previous run and nobody touched since can be skipped.
+    Rows are only valid for the settings `fingerprint` they were written
+    with; opening with different settings drops them. A `read_only` cache
+    (for dry runs) is never modified and just reports nothing on a mismatch.
+    Only used from the main thread.
+    """
+
+    def __init__(self, db_path: str, fingerprint: str, read_only: bool = False) -> None:
+        self._read_only = read_only
+        if read_only:
+            self._db = sqlite3.connect("file:" + quote(os.path.abspath(db_path)) + "?mode=ro",
+                                       uri=True)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, header_hash TEXT)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        try:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        except sqlite3.OperationalError:
+            row = None  # written before settings were recorded
+        self._stale = row is None or row[0] != fingerprint
+        if self._stale and not read_only:
+            self._db.execute("DELETE FROM files")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+            self._stale = False
+
+    def lookup(self, path: str) -> Optional[FileState]:
+        if self._stale:
+            return None
+        row = self._db.execute(
+            "SELECT size, mtime, header_hash FROM files WHERE path = ?",
+            (os.path.abspath(path),)
+        ).fetchone()
+        return FileState(*row) if row else None
+
+    def record(self, path: str, state: FileState) -> None:
+        if self._read_only:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (os.path.abspath(path),) + tuple(state)
+        )
+
+    def close(self) -> None:
+        if not self._read_only:
+            self._db.commit()
+        self._db.close()
+
+def is_current(entry: FileEntry, cached: Optional[FileState]) -> bool:
+    """
+    True if the file is exactly as the tool left it: same size and mtime as
+    recorded, and the header on disk still hashes to the recorded value.
+    """
+    if cached is None or cached.size != entry.size or cached.mtime != entry.mtime:
+        return False
+    try:
+        return header_hash(*read_head(entry.path)) == cached.header_hash
+    except OSError:
+        return False
+
+def cache_excludes(root: str, cache_path: str) -> List[str]:
+    """
+    Exclude patterns that keep the state cache out of discovery when it
+    lives under `root`: the whole .cache/ directory for the default
+    location, otherwise the file and SQLite's -journal/-wal/-shm files.
+    """
+    root = os.path.realpath(root)
+    cache_path = os.path.realpath(cache_path)
+    rel = os.path.relpath(cache_path, root)
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep) or os.path.isabs(rel):
+        return []
+    if cache_path == os.path.join(root, STATE_CACHE_FILE):
+        return ["/" + os.path.dirname(STATE_CACHE_FILE).replace(os.sep, "/") + "/"]
+    rel = glob.escape(rel.replace(os.sep, "/"))
+    return ["/" + rel + suffix for suffix in ("", "-journal", "-wal", "-shm")]
+
+def open_state_cache(cache_path: str, fingerprint: str, dry_run: bool) -> Optional[StateCache]:
+    """
+    Open the cache for a run, or None. A dry run only reads an existing
+    cache and never creates one. A cache that is not a usable database is
+    ignored on a dry run and rebuilt otherwise, with a warning either way.
+    """
+    if dry_run and not os.path.isfile(cache_path):
+        return None
+    try:
+        return StateCache(cache_path, fingerprint, read_only=dry_run)
+    except sqlite3.DatabaseError as e:
+        if dry_run:
+            print(f"WARNING: ignoring unreadable cache {cache_path} ({e})", file=sys.stderr)
+            return None
+        print(f"WARNING: rebuilding unreadable cache {cache_path} ({e})", file=sys.stderr)
+    try:
+        os.remove(cache_path)
+        return StateCache(cache_path, fingerprint)
+    except (OSError, sqlite3.DatabaseError) as e:
+        print(f"WARNING: running without a cache ({e})", file=sys.stderr)
+        return None
+
+# ---------- Engine ----------
+
+class RunOptions(NamedTuple):
+    """Per-run settings shipped to workers along with each file."""
+    name: str
+    email: Optional[str]
+    preserve_width: bool
+    dry_run: bool
+    add_missing: bool
+    track_state: bool = False
+    fsync: str = "none"
+    update_mode: str = "block"
+
+class FileResult(NamedTuple):
+    path: str
+    created_dt: datetime
+    updated_dt: datetime
+    action: str
+    status: str
+    state: Optional[FileState] = None  # set after a write when tracking state
+
+Task = Tuple[FileEntry, Tuple[datetime, datetime], Optional[FileState]]
+
+def _process_task(opts: RunOptions, task: Task) -> FileResult:
+    entry, (created_dt, updated_dt), cached = task
+    if is_current(entry, cached):
+        return FileResult(entry.path, created_dt, updated_dt, "skipped", "cached")
+    head = header = None
+    if opts.update_mode == "updated" and entry.size != 0:
+        # The existing Created stamp is kept, so Updated must not land before it.
+        # Parse once here; process_file reuses the head and the Header.
+        try:
+            head = read_head(entry.path)
+        except OSError:
+            pass  # process_file reports the read failure
+        else:
+            if has_42_header(*head):
+                header = parse_header(head_lines(*head))
+            if header is not None:
+                updated_dt = updated_after_created(header, created_dt, updated_dt)
+    action, status = process_file(
+        entry.path, opts.name, opts.email, created_dt, updated_dt,
+        opts.preserve_width, opts.dry_run, opts.add_missing,
+        size=entry.size, fsync=opts.fsync, update_mode=opts.update_mode,
+        head=head, header=header
+    )
+    state = None
+    if opts.track_state and not opts.dry_run and action != "skipped":
+        try:
+            state = read_file_state(entry.path)
+        except OSError:
+            pass
+    return FileResult(entry.path, created_dt, updated_dt, action, status, state)
+
+def _process_chunk(opts: RunOptions, chunk: List[Task]) -> List[FileResult]:
+    """Worker-process entry point: one shard of files with its timeline slice."""
+    return [_process_task(opts, task) for task in chunk]
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _imap_bounded(pool, fn, items: Iterable, window: int) -> Iterator:
+    """
+    Like Executor.map, but keeps at most `window` items in flight, so a lazy
+    input is consumed while results are being reported.
+    """
+    pending: deque = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class Timeline:
+    """
+    A planned [(created, updated), ...] sequence kept as integer seconds
+    since midnight in two array('l') columns. Datetimes are only built
+    when an entry is read, i.e. when its file is about to be written.
+    """
+    __slots__ = ("day", "created", "updated")
+
+    def __init__(self, day: datetime, created: array, updated: array):
+        self.day = day
+        self.created = created
+        self.updated = updated
+
+    def __len__(self) -> int:
+        return len(self.created)
+
+    def _pair(self, created_s: int, updated_s: int) -> Tuple[datetime, datetime]:
+        return (self.day + timedelta(seconds=created_s),
+                self.day + timedelta(seconds=updated_s))
+
+    def __getitem__(self, i: int) -> Tuple[datetime, datetime]:
+        return self._pair(self.created[i], self.updated[i])
+
+    def __iter__(self) -> Iterator[Tuple[datetime, datetime]]:
+        pair = self._pair
+        for created_s, updated_s in zip(self.created, self.updated):
+            yield pair(created_s, updated_s)
+
+def _plan_timeline_numpy(
+    np, n_files: int, start_of_day: datetime, now_s: int,
+    gap_min_s: int, gap_max_s: int,
+    work_min_s: int, work_max_s: int
+) -> Timeline:
+    """Unseeded plan_timeline with NumPy: one draw for every gap and work duration."""
+    end_s = 24 * 3600 - 1
+    rng = np.random.default_rng()
+    # Row 0: gaps (the last one is unused), row 1: work durations
+    draws = rng.integers([[gap_min_s], [work_min_s]], [[gap_max_s + 1], [work_max_s + 1]],
+                         size=(2, n_files))
+    created = np.zeros(n_files, dtype=np.int64)
+    np.cumsum(draws[0, :-1], out=created[1:])
+
+    total_span = int(created[-1] + draws[1, -1])
+    base = min(now_s, end_s - total_span)
+    if base < 0:
+        base = 1
+
+    created = np.clip(created + base, 0, end_s)
+    updated = np.clip(created + draws[1], 0, end_s)
+    # Same columns as the pure-Python planner, so Timeline hands out plain ints
+    created_col, updated_col = array("l"), array("l")
+    created_col.frombytes(created.astype("l").tobytes())
+    updated_col.frombytes(updated.astype("l").tobytes())
+    return Timeline(start_of_day, created_col, updated_col)
+
 def plan_timeline(
     n_files: int,
     now: datetime,
     gap_min_s: int, gap_max_s: int,
-    work_min_s: int, work_max_s: int
-) -> List[Tuple[datetime, datetime]]:
+    work_min_s: int, work_max_s: int,
+    seed: Optional[int] = None
+) -> Timeline:
     """
     Build [(created, updated), ...] for n_files.
       - All stamps are today (local).
       - Updated - Created in [work_min_s, work_max_s].
       - Created gaps in [gap_min_s, gap_max_s] between files.
       - Fit by end of day.
+    Unseeded plans of NUMPY_MIN_FILES or more are drawn with NumPy when it
+    is installed.
     """
-    if n_files == 0:
-        return []
-
     start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_of_day = start_of_day + timedelta(days=1) - timedelta(seconds=1)
+    if n_files == 0:
+        return Timeline(start_of_day, array("l"), array("l"))
+    end_s = 24 * 3600 - 1
+    now_s = now.hour * 3600 + now.minute * 60 + now.second
 
-    rng = random.Random()
-    gaps = [rng.randint(gap_min_s, gap_max_s) for _ in range(max(n_files - 1, 0))]
-    works = [rng.randint(work_min_s, work_max_s) for _ in range(n_files)]
+    # A seeded plan always comes from `random`, so --seed gives the same
+    # plan whether or not NumPy is installed
+    if n_files >= NUMPY_MIN_FILES and seed is None:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+        else:
+            return _plan_timeline_numpy(np, n_files, start_of_day, now_s, gap_min_s, gap_max_s,
+                                        work_min_s, work_max_s)
 
-    total_gaps = sum(gaps)
-    max_tail = works[-1]
-    total_span = total_gaps + max_tail
+    rng = random.Random(seed)
+    gap = partial(rng.randint, gap_min_s, gap_max_s)
+    work = partial(rng.randint, work_min_s, work_max_s)
+    # Created offsets from the first file: a prefix sum over the gaps
+    created = array("l", accumulate((gap() for _ in range(n_files - 1)), initial=0))
+    works = array("l", (work() for _ in range(n_files)))
 
-    latest_base = end_of_day - timedelta(seconds=total_span)
-    base = min(now, latest_base)
-    if base < start_of_day:
-        base = start_of_day + timedelta(seconds=1)
+    total_span = created[-1] + works[-1]
+    base = min(now_s, end_s - total_span)
+    if base < 0:
+        base = 1
 
-    times: List[Tuple[datetime, datetime]] = []
-    t = base
+    # Shift and clamp to today
     for i in range(n_files):
-        created = t
-        updated = min(created + timedelta(seconds=works[i]), end_of_day)
-        times.append((created, updated))
-        if i < n_files - 1:
-            t = t + timedelta(seconds=gaps[i])
+        c = min(created[i] + base, end_s)
+        created[i] = c
+        works[i] = min(c + works[i], end_s)
+    return Timeline(start_of_day, created, works)
+
+def iter_timeline(
+    now: datetime,
+    gap_min_s: int, gap_max_s: int,
+    work_min_s: int, work_max_s: int,
+    seed: Optional[int] = None,
+    budget: Optional[int] = None
+) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Yield (created, updated) pairs one at a time, for when the number of
+    files is not known up front. Same gaps and work durations as
+    plan_timeline, starting at `now`; stamps past midnight are clamped to today.
+    With a `budget` (expected file count), the start is moved back far enough
+    that that many files fit before midnight even with the longest gaps.
+    Only the running offset is kept, so memory does not grow with the run.
+    """
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    end_s = 24 * 3600 - 1
 
-    # Clamp to today
-    return [(max(start_of_day, c), min(end_of_day, u)) for c, u in times]
+    t = max(now.hour * 3600 + now.minute * 60 + now.second, 1)
+    if budget:
+        t = max(min(t, end_s - (budget - 1) * gap_max_s - work_max_s), 1)
+
+    rng = random.Random(seed)
+    while True:
+        created = min(t, end_s)
+        updated = min(created + rng.randint(work_min_s, work_max_s), end_s)
+        yield (start_of_day + timedelta(seconds=created),
+               start_of_day + timedelta(seconds=updated))
+        t += rng.randint(gap_min_s, gap_max_s)
 
 def infer_default_name() -> Optional[str]:
     """Try git config user.name as a fallback."""
@@ -377,28 +1673,79 @@ def main() -> None:
         help="File extensions to include",
     )
     ap.add_argument("--recursive", action="store_true", help="Recurse into subdirectories")
+    ap.add_argument("--source", choices=["walk", "git"], default="walk",
+                    help="Find files by walking the directory, or from the git index "
+                         "(tracked files only; default: walk)")
+    ap.add_argument("--changed-since", metavar="REV",
+                    help="Only files git reports as changed since REV (e.g. HEAD, origin/main), "
+                         "plus untracked files that are not ignored")
+    ap.add_argument("--staged", action="store_true",
+                    help="Only files with staged changes")
+    ap.add_argument("--respect-gitignore", action="store_true",
+                    help="Skip files and directories ignored by .gitignore")
+    ap.add_argument("--exclude", nargs="*", default=[], metavar="GLOB",
+                    help="Skip files/directories matching these globs (also read from "
+                         f"{HEADERIGNORE_FILE} in the scanned directory)")
     ap.add_argument("--preserve-width", dest="preserve_width", action="store_true",
                     help="Preserve existing header line widths when updating (default)")
     ap.add_argument("--no-preserve-width", dest="preserve_width", action="store_false",
                     help="Allow line width changes when updating")
     ap.set_defaults(preserve_width=True)
+    ap.add_argument("--update-mode", choices=UPDATE_MODES, default="block",
+                    help="Regenerate the whole header 'block' (default), or only patch the "
+                         "By/Created/Updated 'fields' of existing headers in place, or only "
+                         "the Updated date ('updated')")
+    ap.add_argument("--updated-only", dest="update_mode", action="store_const", const="updated",
+                    help="Keep existing Created stamps; only rewrite the Updated date "
+                         "(same as --update-mode updated)")
     ap.add_argument("--dry-run", action="store_true", help="Preview without writing")
-    ap.add_argument("--order", choices=["name", "mtime"], default="name",
-                    help="Order files before timestamping (default: name)")
+    ap.add_argument("--order", choices=["name", "mtime", "walk"], default="name",
+                    help="Order files before timestamping (default: name). "
+                         "'walk' streams files in discovery order as they are found")
     # Timing knobs (defaults match: 1–2 min gaps, 3–6 min work)
     ap.add_argument("--gap-min", type=int, default=60, help="Seconds between consecutive files (min, default 60)")
     ap.add_argument("--gap-max", type=int, default=120, help="Seconds between consecutive files (max, default 120)")
     ap.add_argument("--work-min", type=int, default=180, help="Seconds between Created and Updated (min, default 180)")
     ap.add_argument("--work-max", type=int, default=360, help="Seconds between Created and Updated (max, default 360)")
     ap.add_argument("--seed", type=int, help="Seed for reproducible timing plan")
+    ap.add_argument("--budget", type=int, metavar="N",
+                    help="With --order walk: expected number of files, so the streamed "
+                         "stamps start early enough to fit before midnight")
     # Add headers when missing (default), allow opt-out
     ap.add_argument("--add-missing", dest="add_missing", action="store_true",
                     help="Insert a 42-style header if the file does not have one (default)")
     ap.add_argument("--no-add-missing", dest="add_missing", action="store_false",
                     help="Only update existing headers; do not insert missing ones")
     ap.set_defaults(add_missing=True)
+    ap.add_argument("--cache", action="store_true",
+                    help="Skip files unchanged since this tool last wrote them, using a state "
+                         f"cache at <directory>/{STATE_CACHE_FILE}")
+    ap.add_argument("--cache-file", metavar="PATH",
+                    help="Location of the state cache (implies --cache)")
+    ap.add_argument("--fsync", choices=FSYNC_MODES, default="none",
+                    help="Flush writes to disk: 'each' file and its directory as it is written, "
+                         "or 'batch' directory flushes once at the end (default: none)")
+    ap.add_argument("--jobs", "-j", type=int,
+                    help="Number of workers (default: 1 thread, or one process per CPU)")
+    ap.add_argument("--backend", choices=["thread", "process"], default="thread",
+                    help="Run workers as threads or processes (default: thread)")
+    ap.add_argument("--chunk-size", type=int, default=512,
+                    help="Files per work unit sent to each process (default 512)")
 
     args = ap.parse_args()
+    if args.jobs is None:
+        args.jobs = (os.cpu_count() or 1) if args.backend == "process" else 1
+    if args.jobs < 1:
+        ap.error("--jobs must be at least 1.")
+    if args.chunk_size < 1:
+        ap.error("--chunk-size must be at least 1.")
+    if args.budget is not None:
+        if args.order != "walk":
+            ap.error("--budget only applies to --order walk.")
+        if args.budget < 1:
+            ap.error("--budget must be at least 1.")
+    if args.changed_since and args.changed_since.startswith("-"):
+        ap.error(f"--changed-since expects a revision, not an option: {args.changed_since}")
 
     name = args.name or os.getenv("FORTY2_NAME") or infer_default_name()
     if not name:
@@ -406,59 +1753,127 @@ def main() -> None:
 
     email = args.email or os.getenv("FORTY2_EMAIL")
 
-    files = collect_files(args.directory, args.ext, args.recursive)
-    if not files:
-        print("No files found with the given extensions.")
-        return
+    cache_path = None
+    if args.cache or args.cache_file:
+        cache_path = args.cache_file or os.path.join(args.directory, STATE_CACHE_FILE)
 
-    if args.order == "mtime":
-        files.sort(key=lambda p: os.path.getmtime(p))
+    exclude = ExcludeMatcher(
+        args.exclude + load_ignore_file(os.path.join(args.directory, HEADERIGNORE_FILE))
+        + (cache_excludes(args.directory, cache_path) if cache_path else [])
+    )
 
-    if args.seed is not None:
-        random.seed(args.seed)
+    if args.changed_since or args.staged:
+        try:
+            discovered = iter_changed_files(
+                args.directory, args.ext, args.recursive, exclude,
+                since=args.changed_since, staged=args.staged
+            )
+        except (OSError, subprocess.CalledProcessError):
+            ap.error(f"could not read changed files from git in {args.directory}")
+    elif args.source == "git":
+        try:
+            discovered = iter_git_files(args.directory, args.ext, args.recursive, exclude)
+        except (OSError, subprocess.CalledProcessError):
+            ap.error(f"--source git: could not list tracked files in {args.directory}")
+    else:
+        gitignore = GitIgnore.for_root(args.directory) if args.respect_gitignore else None
+        discovered = iter_files(args.directory, args.ext, args.recursive, exclude, gitignore)
 
     now = datetime.now()
-    times = plan_timeline(
-        n_files=len(files),
-        now=now,
-        gap_min_s=args.gap_min,
-        gap_max_s=args.gap_max,
-        work_min_s=args.work_min,
-        work_max_s=args.work_max
-    )
+    if args.order == "walk":
+        # No global ordering: start on each file as soon as it is found
+        files: Iterable[FileEntry] = discovered
+        times: Iterable[Tuple[datetime, datetime]] = iter_timeline(
+            now=now,
+            gap_min_s=args.gap_min,
+            gap_max_s=args.gap_max,
+            work_min_s=args.work_min,
+            work_max_s=args.work_max,
+            seed=args.seed,
+            budget=args.budget
+        )
+    else:
+        files = sort_files(discovered, args.order)
+        if not files:
+            print("No files found with the given extensions.")
+            return
+
+        times = plan_timeline(
+            n_files=len(files),
+            now=now,
+            gap_min_s=args.gap_min,
+            gap_max_s=args.gap_max,
+            work_min_s=args.work_min,
+            work_max_s=args.work_max,
+            seed=args.seed
+        )
 
     updated_cnt = 0
     inserted_cnt = 0
+    unchanged_cnt = 0
     skipped_cnt = 0
 
-    for path, (created_dt, updated_dt) in zip(files, times):
-        changed, status = process_file_update_existing(
-            path, name, email, created_dt, updated_dt, args.preserve_width, args.dry_run
-        )
-        if changed:
+    opts = RunOptions(name, email, args.preserve_width, args.dry_run, args.add_missing,
+                      track_state=cache_path is not None, fsync=args.fsync,
+                      update_mode=args.update_mode)
+    cache = None
+    if cache_path:
+        cache = open_state_cache(cache_path, options_fingerprint(opts), args.dry_run)
+    # Cache lookups happen here, in the main thread, as tasks are handed out
+    tasks = ((entry, stamps, cache.lookup(entry.path) if cache else None)
+             for entry, stamps in zip(files, times))
+    # Results come back in submission order, so the report stays in file order
+    window = args.jobs * 4
+    if args.backend == "process":
+        pool = ProcessPoolExecutor(max_workers=args.jobs)
+        chunks = _imap_bounded(pool, partial(_process_chunk, opts),
+                               _chunked(tasks, args.chunk_size), window)
+        results = chain.from_iterable(chunks)
+    elif args.jobs > 1:
+        pool = ThreadPoolExecutor(max_workers=args.jobs)
+        results = _imap_bounded(pool, partial(_process_task, opts), tasks, window)
+    else:
+        pool = None
+        results = map(partial(_process_task, opts), tasks)
+    written_dirs = set()
+    for path, created_dt, updated_dt, action, status, state in results:
+        if cache and state:
+            cache.record(path, state)
+        if args.fsync == "batch" and action in ("updated", "inserted"):
+            written_dirs.add(os.path.dirname(os.path.realpath(path)))
+        if action == "updated":
             updated_cnt += 1
-            print(f"{'WOULD UPDATE' if args.dry_run else 'UPDATED'}: {path} "
-                  f"[{format_42(created_dt)} -> {format_42(updated_dt)}]")
-            continue
-
-        # No header found: optionally insert one
-        if status == "no-42-header" and args.add_missing:
-            did_insert, istatus = insert_header_if_missing(
-                path, name, email, created_dt, updated_dt, args.dry_run
-            )
-            if did_insert:
-                inserted_cnt += 1
-                print(f"{'WOULD INSERT' if args.dry_run else 'INSERTED'}: {path} "
-                      f"[{format_42(created_dt)} -> {format_42(updated_dt)}]")
+            if args.update_mode == "updated":
+                stamps = f"Updated {format_42(updated_dt)}"
             else:
-                skipped_cnt += 1
-                if istatus not in ("already-has-header",):
-                    print(f"SKIP ({istatus}): {path}")
+                stamps = f"{format_42(created_dt)} -> {format_42(updated_dt)}"
+            print(f"{'WOULD UPDATE' if args.dry_run else 'UPDATED'}: {path} [{stamps}]")
+        elif action == "inserted":
+            inserted_cnt += 1
+            print(f"{'WOULD INSERT' if args.dry_run else 'INSERTED'}: {path} "
+                  f"[{format_42(created_dt)} -> {format_42(updated_dt)}]")
+        elif action == "unchanged":
+            unchanged_cnt += 1
         else:
             skipped_cnt += 1
-            # quiet skip for unchanged/ok
+            # quiet skip for empty files and files left without a header
+            if status.endswith("-fail"):
+                print(f"SKIP ({status}): {path}")
+
+    if pool:
+        pool.shutdown()
+    for d in sorted(written_dirs):
+        fsync_dir(d)
+    if cache:
+        cache.close()
+
+    total = updated_cnt + inserted_cnt + unchanged_cnt + skipped_cnt
+    if not total:
+        print("No files found with the given extensions.")
+        return
 
-    print(f"\nDone. Files: {len(files)}. Updated: {updated_cnt}. Inserted: {inserted_cnt}. Skipped: {skipped_cnt}.")
+    print(f"\nDone. Files: {total}. Updated: {updated_cnt}. Inserted: {inserted_cnt}. "
+          f"Unchanged: {unchanged_cnt}. Skipped: {skipped_cnt}.")
 
 if __name__ == "__main__":
     main()